@@ -0,0 +1,87 @@
+"""
+Throughput of the Markdown and HTML converters, see :mod:`docxgen.convert`.
+
+Usage::
+
+    python benchmarks/convert.py [megabytes]
+
+"""
+import sys
+import time
+
+import six
+from docxgen import Document, h2, li, paragraph, run
+from docxgen.convert import html, markdown
+
+MARKDOWN = six.u('''## Section %(i)d
+
+Quarterly figures for **region %(i)d** were *above* the forecast, see the
+[dashboard](http://example.com/report/%(i)d) and `metrics.csv` for details.
+
+- revenue grew by %(i)d%%
+- costs were **flat**
+
+| Quarter | Revenue |
+|---------|--------:|
+| Q1      | %(i)d   |
+| Q2      | %(i)d   |
+
+''')
+
+HTML = six.u('''<h2>Section %(i)d</h2>
+<p>Quarterly figures for <b>region %(i)d</b> were <i>above</i> the forecast,
+see the <a href="http://example.com/report/%(i)d">dashboard</a> and
+<code>metrics.csv</code> for details.</p>
+<ul><li>revenue grew by %(i)d%%</li><li>costs were <b>flat</b></li></ul>
+<table><tr><th>Quarter</th><th>Revenue</th></tr>
+<tr><td>Q1</td><td>%(i)d</td></tr><tr><td>Q2</td><td>%(i)d</td></tr></table>
+''')
+
+
+def source(template, size):
+    chunks = []
+    total = i = 0
+    while total < size:
+        chunk = template % {'i': i}
+        chunks.append(chunk)
+        total += len(chunk)
+        i += 1
+    return ''.join(chunks), i
+
+
+def builders(sections):
+    '''the sections mapped by hand to the docxgen builders, without the
+    tables and hyperlinks.'''
+    doc = Document()
+    for i in range(sections):
+        doc.append(
+            h2(run('Section %d' % i)),
+            paragraph([run('Quarterly figures for '),
+                       run('region %d' % i, ['b']), run(' were '),
+                       run('above', ['i']), run(' the forecast, see the '),
+                       run('dashboard', ['h']), run(' and '),
+                       run('metrics.csv'), run(' for details.')]),
+            li([run('revenue grew by %d%%' % i)], 'disc'),
+            li([run('costs were '), run('flat', ['b'])], 'disc'))
+    return doc
+
+
+def bench(name, convert, text):
+    start = time.time()
+    convert(text)
+    elapsed = time.time() - start
+    size = len(text.encode('utf-8')) / 1e6
+    print('%-10s %6.1fMB %7.2fs %6.2fMB/s' % (name, size, elapsed,
+                                              size / elapsed))
+
+
+def main():
+    size = int(float(sys.argv[1] if len(sys.argv) > 1 else 4) * 1e6)
+    text, sections = source(MARKDOWN, size)
+    bench('markdown', markdown, text)
+    bench('builders', lambda text: builders(sections), text)
+    text, sections = source(HTML, size)
+    bench('html', html, text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Save time of a large document by the number of deflate workers, see
+:mod:`docxgen.deflate`.
+
+Usage::
+
+    python benchmarks/deflate.py [megabytes]
+
+"""
+import sys
+import time
+from io import BytesIO
+
+import docxgen
+from docxgen.convert import markdown
+
+
+def build(size):
+    '''a document of about *size* bytes of ``word/document.xml``.'''
+    chunk = 10000
+    text = '\n\n'.join('Paragraph %d of the report, **figures for region '
+                        '%d**' % (i, i) for i in range(chunk))
+    doc = markdown(text)
+    # every chunk adds about as many bytes again
+    for i in range(size // len(doc.dumps())):
+        markdown(text, doc)
+    return doc
+
+
+def bench(name, doc, workers, baseline=None):
+    best = None
+    for i in range(3):
+        start = time.time()
+        doc.save(BytesIO(), workers=workers)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    speedup = ' %5.2fx' % (baseline / best) if baseline else ''
+    print('%-10s %7.2fs%s' % (name, best, speedup))
+    return best
+
+
+def main():
+    size = int(float(sys.argv[1] if len(sys.argv) > 1 else 32) * 1e6)
+    doc = build(size)
+    print('word/document.xml %.1fMB' % (len(doc.dumps()) / 1e6))
+
+    # zipfile deflates every part serially
+    minimum, docxgen._parallel_min = docxgen._parallel_min, sys.maxsize
+    try:
+        serial = bench('zipfile', doc, 1)
+    finally:
+        docxgen._parallel_min = minimum
+    for workers in (1, 2, 4):
+        bench('workers=%d' % workers, doc, workers, serial)
+
+if __name__ == '__main__':
+    main()
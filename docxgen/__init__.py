@@ -1,22 +1,11 @@
-import zipfile
-import sys
+import os
 
 __version__ = '0.1.3'
 
+from contextlib import closing
 from functools import partial
-if sys.version_info < (2, 7):
-    # add context manager to ZipFile
-    from contextlib import contextmanager
-
-    @contextmanager
-    def ZipFile(file, *args, **kwargs):
-        f = zipfile.ZipFile(file, *args, **kwargs)
-        yield f
-        f.close()
-else:
-    from zipfile import ZipFile
-from pkg_resources import resource_string
-from six import string_types
+import six
+from six import string_types, integer_types
 from lxml import etree
 from lxml.builder import ElementMaker
 
@@ -56,10 +45,86 @@ nsmap = {
 }
 
 
+def _zipfile(file, *args, **kwargs):
+    '''
+    Open a :class:`zipfile.ZipFile` usable as a context manager.
+
+    :mod:`zipfile` drags in :mod:`shutil`, :mod:`inspect` and friends, so it
+    is imported on first use rather than with the package.
+    '''
+    import zipfile
+    return closing(zipfile.ZipFile(file, *args, **kwargs))
+
+_ZIP_DEFLATED = 8  # zipfile.ZIP_DEFLATED
+_zip_epoch = (1980, 1, 1, 0, 0, 0)  # the earliest date zip can represent
+_parallel_min = 4 << 20  # smallest part deflated in parallel
+_templates = {}
+
+
+def _resource_string(part):
+    '''return the bytes of the template *part*, read once per process.'''
+    try:
+        return _templates[part]
+    except KeyError:
+        path = os.path.join(os.path.dirname(__file__), 'templates', part)
+        with open(path, 'rb') as f:
+            bytes = _templates[part] = f.read()
+        return bytes
+
+
+def _base_rels():
+    '''number of relationships in the document.xml.rels template.'''
+    return _resource_string('word/_rels/document.xml.rels').count(
+        b'<Relationship ')
+
+
+_checks = True  # per-element checks in the builders
+_strict = False  # validate against the schema on save
+_schema = None
+
+
+def set_validation(level):
+    """
+    Set the validation *level* of the builders and :meth:`Document.save`:
+
+    ``off``
+        skip all per-element checks for maximum throughput.
+    ``default``
+        check the arguments of the builders as they are called.
+    ``strict``
+        per-element checks, and validate ``word/document.xml``, headers
+        and footers against a WordprocessingML schema subset on save.
+
+    Use :func:`validate` to check the documents built with ``off`` in a
+    separate batch step.
+    """
+    global _checks, _strict
+    if level not in ('off', 'default', 'strict'):
+        raise ValueError('unknown validation level %r' % (level,))
+    _checks = level != 'off'
+    _strict = level == 'strict'
+
+
+def validate(element):
+    """
+    Validate *element*, e.g. ``document``, ``hdr`` or ``p``, against the
+    bundled WordprocessingML schema subset, which checks the child order of
+    documents, paragraphs, runs, tables and sections.
+
+    Raises :class:`lxml.etree.DocumentInvalid` if *element* is invalid.
+    """
+    global _schema
+    if _schema is None:
+        path = os.path.join(os.path.dirname(__file__), 'schemas', 'wml.xsd')
+        _schema = etree.XMLSchema(etree.parse(path))
+    _schema.assertValid(element)
+
+
 def qname(namespace, name):
     '''decorate the name with fully qualified namespace.'''
     namespace = nsmap.get(namespace, namespace)
-    assert(namespace in nsmap.values())
+    if _checks:
+        assert(namespace in nsmap.values())
     return '{%s}%s' % (namespace, name)
 
 typemap = {}
@@ -84,6 +149,10 @@ E = ElementMaker(namespace=nsmap['w'], nsmap=nsmap, typemap=typemap)
 H = ElementMaker(namespace=nsmap['relationship'], nsmap=nsmap, typemap=typemap)
 
 
+# rPr children written by run(), in schema order.
+_rpr_order = ('rStyle', 'b', 'i', 'color', 'sz', 'u')
+
+
 def run(text='', style=None):
     """
     Returns a ``r`` (text run) element with the specified style for the text.
@@ -123,24 +192,27 @@ def run(text='', style=None):
     if hasattr(style, 'tag') and style.tag == qname('w', 'rPr'):
         run.append(style)
     elif style is not None and len(style) != 0:
-        runProperties = E.rPr()
+        properties = {}
         for item in style:
             if item == 'i':
-                runProperties.append(E('i'))
+                properties['i'] = [E('i')]
             elif item == 'b':
-                runProperties.append(E('b'))
+                properties['b'] = [E('b')]
             elif item == 'h':
-                runProperties.append(E.rStyle(val='Hyperlink'))
+                properties['rStyle'] = [E.rStyle(val='Hyperlink')]
             elif item == 'u':
-                runProperties.append(E.u(val="single"))
+                properties['u'] = [E.u(val="single")]
             elif item.find('color') != -1:
-                color = E.color(val=item.split(':')[1])
-                runProperties.append(color)
+                properties['color'] = [E.color(val=item.split(':')[1])]
             elif item.find('size') != -1:
                 sizeLatin = E.sz(val=item.split(':')[1])
-                runProperties.append(sizeLatin)
                 sizeComplex = E.szCs(val=item.split(':')[1])
-                runProperties.append(sizeComplex)
+                properties['sz'] = [sizeLatin, sizeComplex]
+        # the rPr children are ordered by the schema, whatever the order
+        # of *style*.
+        runProperties = E.rPr(*[el for name in _rpr_order
+                                if name in properties
+                                for el in properties[name]])
         run.append(runProperties)
 
     if hasattr(text, 'tag') and text.tag in (
@@ -197,7 +269,8 @@ def li(runs, style):
         'disc': '3',
         'square': '4',
     }
-    assert style in listmap
+    if _checks:
+        assert style in listmap
     # TODO: support nested list
     return paragraph(
         runs,
@@ -235,7 +308,41 @@ def pagebreak():
     return paragraph([run(E.br(type='page'))])
 
 
-def table(cells, style=None):
+def _insert_before(parent, child, names):
+    '''insert *child* before the first element of *parent* in *names*.'''
+    for index, el in enumerate(parent):
+        if etree.QName(el).localname in names:
+            parent.insert(index, child)
+            return
+    parent.append(child)
+
+
+# tblPr children following tblW and tblLayout respectively.
+_tbl_after_width = ('jc', 'tblCellSpacing', 'tblInd', 'tblBorders', 'shd',
+                    'tblLayout', 'tblCellMar', 'tblLook', 'tblCaption',
+                    'tblDescription', 'tblPrChange')
+_tbl_after_layout = _tbl_after_width[_tbl_after_width.index('tblLayout') + 1:]
+
+
+def _column_widths(cells, total, sample):
+    '''distribute *total* among the columns by the text length of the
+    first *sample* rows.'''
+    rows = cells[:sample]
+    # ragged rows: the grid spans the widest row.
+    weights = [1] * max(len(row) for row in rows)
+    for row in rows:
+        for index, cell in enumerate(row):
+            # cap the weight so that one long paragraph can not starve the
+            # other columns.
+            length = min(len(''.join(cell.itertext())), 40)
+            weights[index] = max(weights[index], length)
+    scale = float(total) / sum(weights)
+    widths = [int(weight * scale) for weight in weights]
+    widths[-1] += total - sum(widths)
+    return widths
+
+
+def table(cells, style=None, widths=None, header=0, sample=100):
     """
     Returns a ``tbl`` (table) element with specified style from the cells.
 
@@ -246,47 +353,336 @@ def table(cells, style=None):
     Each cell MUST be a ``tc`` (table cell) element; or a paragraph or a text
     run.
 
+    *widths*, if specified, is either a list of the column widths or the
+    total width of the table, distributed among the columns by the length
+    of the text in the first *sample* rows, all measured in twentieths of a
+    point. The table then has the ``fixed`` layout, so Word does not need
+    to measure every cell to lay it out. Otherwise the columns of the
+    ``tblGrid`` have no width and Word sizes them to fit the content. The
+    cells built from paragraphs or text runs take the width of their
+    column rather than carry their own.
+
+    *header* is the number of leading rows repeated at the top of every
+    page the table spans.
+
+    For example::
+
+        table(rows, 'LightShading-Accent1', widths=[2880, 4320, 2160],
+              header=1)
+
     """
-    assert(len(cells) > 0)
-    assert(len(cells[0]) > 0)
+    if _checks:
+        assert(len(cells) > 0)
+        assert(len(cells[0]) > 0)
 
     tbl = E.tbl()
     if hasattr(style, 'tag') and style.tag == qname('w', 'tblPr'):
-        run.append(style)
+        tblPr = style
+    elif style is not None:
+        tblPr = E.tblPr(
+            E.tblStyle(val=style)
+        )
     else:
+        tblPr = E.tblPr()
+    tbl.append(tblPr)
+
+    if widths is not None:
+        if not isinstance(widths, (list, tuple)):
+            widths = _column_widths(cells, widths, sample)
+        elif _checks:
+            assert len(widths) == len(cells[0])
+        for name in ('tblW', 'tblLayout'):
+            for el in tblPr.findall(qname('w', name)):
+                tblPr.remove(el)
+        _insert_before(tblPr, E.tblW(w=str(int(sum(widths))), type='dxa'),
+                       _tbl_after_width)
+        _insert_before(tblPr, E.tblLayout(type='fixed'), _tbl_after_layout)
         tbl.append(
-            E.tblPr(
-                E.tblStyle(val=style)
-            )
+            E.tblGrid(*[E.gridCol(w=str(int(width))) for width in widths])
         )
-    # TODO: support tblGrid
+    else:
+        # the grid MUST be present, ragged rows span the widest row.
+        columns = max(len(row) for row in cells)
+        tbl.append(E.tblGrid(*[E.gridCol() for i in range(columns)]))
 
+    r, p, tc = qname('w', 'r'), qname('w', 'p'), qname('w', 'tc')
     # iterate all rows
-    for row in cells:
-        tr = E.tr(
-            E.trPr(
-                E.cnfStyle(val='000000100000')
-            )
+    for index, row in enumerate(cells):
+        trPr = E.trPr(
+            E.cnfStyle(val='000000100000')
         )
+        if index < header:
+            trPr.append(E.tblHeader())
+        tr = E.tr(trPr)
         for cell in row:
-            assert hasattr(cell, 'tag')
-            if cell.tag == qname(cell.prefix, 'r'):
+            if _checks:
+                assert hasattr(cell, 'tag')
+            if cell.tag == r:
                 cell = paragraph([cell])
 
-            if cell.tag == qname(cell.prefix, 'p'):
-                cell = E.tc(
-                    E.tcPr(
-                        E.tcW(w='0', type='auto')
-                    ),
-                    cell
-                )
+            if cell.tag == p:
+                cell = E.tc(cell)
 
-            if cell.tag == qname(cell.prefix, 'tc'):
+            if cell.tag == tc:
                 tr.append(cell)
         tbl.append(tr)
     return tbl
 
 
+def field(instr, text='1'):
+    """
+    Returns a ``fldSimple`` (simple field) element, which Word computes on
+    rendering, e.g. ``PAGE`` or ``NUMPAGES``.
+
+    *text* is the placeholder displayed until the field is updated.
+
+    """
+    return E.fldSimple(
+        {qname('w', 'instr'): ' %s ' % instr},
+        run(text)
+    )
+
+pagenumber = partial(field, 'PAGE')
+numpages = partial(field, 'NUMPAGES')
+
+
+# part kind -> (relationship type, content type)
+_part_types = {
+    'header': (
+        'http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships/header',
+        'application/vnd.openxmlformats-officedocument.'
+        'wordprocessingml.header+xml'),
+    'footer': (
+        'http://schemas.openxmlformats.org/officeDocument/2006/'
+        'relationships/footer',
+        'application/vnd.openxmlformats-officedocument.'
+        'wordprocessingml.footer+xml'),
+}
+
+
+def _tostring(root, pretty_print=False, canonical=False):
+    if canonical:
+        # C14N sorts the attributes, pretty_print does not apply.
+        return _xml_declaration.encode('utf-8') + etree.tostring(
+            root, method='c14n')
+    return etree.tostring(root, xml_declaration=True, standalone=True,
+                          encoding='UTF-8', pretty_print=pretty_print)
+
+
+class Part(object):
+    """
+    A standalone part of the package, e.g. a header or a footer.
+
+    The part is serialized on the first save, the bytes are then reused by
+    every :class:`Document` referencing it. Build the part once and share
+    it across documents; changes to *root* after the first save are not
+    picked up.
+    """
+    def __init__(self, kind, root):
+        assert kind in _part_types
+        self.kind = kind
+        self.root = root
+        self._bytes = {}
+
+    @property
+    def reltype(self):
+        return _part_types[self.kind][0]
+
+    @property
+    def content_type(self):
+        return _part_types[self.kind][1]
+
+    def tostring(self, pretty_print=False, canonical=False):
+        """
+        Returns the serialized part, cached after the first call with the
+        same arguments, see :meth:`Document.iterparts`.
+        """
+        key = pretty_print, canonical
+        try:
+            return self._bytes[key]
+        except KeyError:
+            bytes = self._bytes[key] = _tostring(self.root, pretty_print,
+                                                 canonical)
+            return bytes
+
+
+def header(paragraphs):
+    """
+    Returns a header :class:`Part` containing *paragraphs*, a non-empty
+    list of ``p`` (paragraph) elements or one ``p`` element, see
+    :func:`paragraph`.
+
+    For example::
+
+        header(paragraph([run('ACME Corp.'), spaces(), pagenumber()]))
+
+    """
+    if not isinstance(paragraphs, list):
+        paragraphs = [paragraphs]
+    if _checks:
+        assert(len(paragraphs) > 0)
+    return Part('header', E.hdr(*paragraphs))
+
+
+def footer(paragraphs):
+    """
+    Returns a footer :class:`Part` containing *paragraphs*, see
+    :func:`header`.
+
+    """
+    if not isinstance(paragraphs, list):
+        paragraphs = [paragraphs]
+    if _checks:
+        assert(len(paragraphs) > 0)
+    return Part('footer', E.ftr(*paragraphs))
+
+
+# sectPr children following the header/footer references and titlePg.
+_sect_after_refs = ('footnotePr', 'endnotePr', 'type', 'pgSz', 'pgMar',
+                    'paperSrc', 'pgBorders', 'lnNumType', 'pgNumType',
+                    'cols', 'formProt', 'vAlign', 'noEndnote', 'titlePg',
+                    'textDirection', 'bidi', 'rtlGutter', 'docGrid',
+                    'printerSettings', 'sectPrChange')
+_sect_after_title = _sect_after_refs[_sect_after_refs.index('titlePg') + 1:]
+
+
+# characters XML 1.0 does not allow, even escaped.
+_illegal_chars = six.u('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+_illegal_xml = None
+
+
+def _escape(text):
+    '''escape *text* for XML character data and attribute values.'''
+    global _illegal_xml
+    if _illegal_xml is None:
+        import re
+        _illegal_xml = re.compile(_illegal_chars)
+    if _illegal_xml.search(text):
+        raise ValueError('All strings must be XML compatible: Unicode or '
+                         'ASCII, no NULL bytes or control characters')
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace(
+        '>', '&gt;').replace('"', '&quot;')
+
+
+def _w3cdtf(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _text(value):
+    if isinstance(value, string_types):
+        return value
+    if isinstance(value, (list, tuple)):
+        return ','.join(value)
+    return str(value)
+
+_xml_declaration = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# core property -> (element template, formatter), in serialization order.
+_core_props = (
+    ('category', '<cp:category>%s</cp:category>', _text),
+    ('contentStatus', '<cp:contentStatus>%s</cp:contentStatus>', _text),
+    ('keywords', '<cp:keywords>%s</cp:keywords>', _text),
+    ('lastModifiedBy', '<cp:lastModifiedBy>%s</cp:lastModifiedBy>', _text),
+    ('lastPrinted', '<cp:lastPrinted>%s</cp:lastPrinted>', _w3cdtf),
+    ('revision', '<cp:revision>%s</cp:revision>', _text),
+    ('version', '<cp:version>%s</cp:version>', _text),
+    ('title', '<dc:title>%s</dc:title>', _text),
+    ('subject', '<dc:subject>%s</dc:subject>', _text),
+    ('creator', '<dc:creator>%s</dc:creator>', _text),
+    ('description', '<dc:description>%s</dc:description>', _text),
+    ('identifier', '<dc:identifier>%s</dc:identifier>', _text),
+    ('language', '<dc:language>%s</dc:language>', _text),
+    ('created', '<dcterms:created xsi:type="dcterms:W3CDTF">%s'
+                '</dcterms:created>', _w3cdtf),
+    ('modified', '<dcterms:modified xsi:type="dcterms:W3CDTF">%s'
+                 '</dcterms:modified>', _w3cdtf),
+)
+
+_core_skeleton = _xml_declaration + (
+    '<cp:coreProperties xmlns:cp="%s" xmlns:dc="%s" xmlns:dcterms="%s" '
+    'xmlns:dcmitype="%s" xmlns:xsi="%s">' % tuple(
+        nsmap[k] for k in ('cp', 'dc', 'dcterms', 'dcmitype', 'xsi'))
+    ) + '%s</cp:coreProperties>'
+
+# namespaces of the custom properties, kept out of nsmap and thus out of
+# every element built by E.
+_props_nsmap = {
+    'custom': ('http://schemas.openxmlformats.org/officeDocument/2006/'
+               'custom-properties'),
+    'vt': ('http://schemas.openxmlformats.org/officeDocument/2006/'
+           'docPropsVTypes'),
+}
+
+_app_skeleton = _xml_declaration + (
+    '<Properties xmlns="%s" xmlns:vt="%s">'
+    '<Template>Normal.dotm</Template><TotalTime>0</TotalTime>'
+    '<Words>%%(words)d</Words><Characters>%%(characters)d</Characters>'
+    '<Application>Microsoft Macintosh Word</Application>'
+    '<DocSecurity>0</DocSecurity><Paragraphs>%%(paragraphs)d</Paragraphs>'
+    '<ScaleCrop>false</ScaleCrop><Company></Company>'
+    '<LinksUpToDate>false</LinksUpToDate>'
+    '<CharactersWithSpaces>%%(characters_with_spaces)d'
+    '</CharactersWithSpaces><SharedDoc>false</SharedDoc>'
+    '<HyperlinksChanged>false</HyperlinksChanged>'
+    '<AppVersion>14.0000</AppVersion></Properties>' % (
+        nsmap['ep'], _props_nsmap['vt']))
+
+_custom_skeleton = _xml_declaration + (
+    '<Properties xmlns="%s" xmlns:vt="%s">' % (
+        _props_nsmap['custom'], _props_nsmap['vt'])) + '%s</Properties>'
+_custom_property = ('<property fmtid="{D5CDD505-2E9C-101B-9397-08002B2CF9AE}"'
+                    ' pid="%d" name="%s"><vt:%s>%s</vt:%s></property>')
+
+
+def _custom_value(value):
+    '''returns the (vt type, text) of the custom property *value*.'''
+    if isinstance(value, bool):
+        return 'bool', value and 'true' or 'false'
+    if isinstance(value, integer_types):
+        return 'i4', str(value)
+    if isinstance(value, float):
+        return 'r8', repr(value)
+    if hasattr(value, 'strftime'):
+        return 'filetime', _w3cdtf(value)
+    return 'lpwstr', _escape(_text(value))
+
+
+_w_p, _w_t = qname('w', 'p'), qname('w', 't')
+
+
+def _count(element, stats):
+    '''add the paragraph, word and character counts of *element* to
+    *stats*.'''
+    p, t = _w_p, _w_t
+    paragraphs = [element] if element.tag == p else element.iter(p)
+    for para in paragraphs:
+        text = ''.join(el.text or '' for el in para.iter(t))
+        words = text.split()
+        if not words:
+            continue
+        stats['paragraphs'] += 1
+        stats['words'] += len(words)
+        stats['characters'] += sum(len(word) for word in words)
+        stats['characters_with_spaces'] += len(text)
+
+
+def _zipinfo(name, date_time=None):
+    '''returns a deflated :class:`zipfile.ZipInfo` for the entry *name*.'''
+    import time
+    import zipfile
+    info = zipfile.ZipInfo(name, date_time or time.localtime()[:6])
+    info.compress_type = _ZIP_DEFLATED
+    info.external_attr = 0o600 << 16
+    return info
+
+
+def _hash_part(digest, name, bytes):
+    '''feed the part *name* and its *bytes* to the hash *digest*.'''
+    digest.update(('%s\0%d\0' % (name, len(bytes))).encode('utf-8'))
+    digest.update(bytes)
+
+
 class Document(object):
     """
     A Document instance contains all the parts of Microsoft Word document.
@@ -296,7 +692,14 @@ class Document(object):
             E.body()
         )
         self.meta = {}
+        self.custom = {}
         self.rels = []  # urls for hyperlinks
+        self._relindex = {}  # rels -> index, see add_relationship()
+        self._indexed = 0
+        self.stats = dict(paragraphs=0, words=0, characters=0,
+                          characters_with_spaces=0)
+        # the (number, last) of the body elements accounted in stats.
+        self._counted = (0, None)
 
     @property
     def body(self):
@@ -305,15 +708,62 @@ class Document(object):
         """
         return self.doc[0]
 
+    def append(self, *elements):
+        """
+        Append *elements* to the body, ahead of the section properties, and
+        update the word and paragraph counts reported in
+        ``docProps/app.xml``.
+
+        Elements added to or removed from :attr:`body` directly are noticed
+        by the number of body elements and the last one, and then counted
+        on :meth:`save` by walking the whole body instead. Changes within
+        the elements, e.g. to the text of a run, are not noticed.
+        """
+        body = self.body
+        # only look at the last child, find() and len() are linear in the
+        # body size; the number of elements is checked on save.
+        last = next(body.iterchildren(reversed=True), None)
+        if last is not None and last.tag == qname('w', 'sectPr'):
+            sectPr = last
+            last = sectPr.getprevious()
+        else:
+            sectPr = None
+        size, counted_last = self._counted
+        counted = counted_last is last
+        for element in elements:
+            if sectPr is None:
+                body.append(element)
+            else:
+                sectPr.addprevious(element)
+            if counted:
+                _count(element, self.stats)
+        if counted and elements:
+            self._counted = (size + len(elements), elements[-1])
+
     def update(self, *args, **kwargs):
         """
         update the core properties of the document.
+
+        Supported keys are ``title``, ``subject``, ``creator``,
+        ``description``, ``identifier``, ``language``, ``category``,
+        ``contentStatus``, ``keywords`` (a string or a list of strings),
+        ``lastModifiedBy``, ``revision``, ``version``, and
+        :class:`datetime.datetime` values for ``created``, ``modified`` and
+        ``lastPrinted``.
         """
         self.meta.update(*args, **kwargs)
 
+    def update_custom(self, *args, **kwargs):
+        """
+        update the custom properties of the document, saved in
+        ``docProps/custom.xml``. Values may be strings, :class:`bool`,
+        :class:`int`, :class:`float` or :class:`datetime.datetime`.
+        """
+        self.custom.update(*args, **kwargs)
+
     @classmethod
     def load(cls, f):
-        with ZipFile(f) as zippy:
+        with _zipfile(f) as zippy:
             root = etree.parse(zippy.open('word/document.xml'))
             return cls(root.getroot())
 
@@ -326,48 +776,167 @@ class Document(object):
         """
         return etree.tostring(self.doc, pretty_print=pretty_print)
 
-    def get_core_props(self):
-        _nsmap = dict((k, v) for k, v in nsmap.items() if k in (
-            'cp', 'dc', 'dcterms', 'dcmitype', 'xsi'))
-        core = etree.Element(qname('cp', 'coreProperties'), nsmap=_nsmap)
-
-        if 'lastModifiedBy' in self.meta:
-            key = 'lastModifiedBy'
-            el = etree.SubElement(core, qname('cp', key))
-            el.text = self.meta[key]
-
-        if 'keywords' in self.meta:
-            key = 'keywords'
-            el = etree.SubElement(core, qname('cp', key))
-            if isinstance(self.meta[key], string_types):
-                el.text = self.meta[key]
-            else:
-                el.text = ','.join(self.meta[key])
+    def add_relationship(self, target):
+        """
+        Register *target*, an external url of a hyperlink or a :class:`Part`,
+        in ``word/_rels/document.xml.rels`` and returns its relationship id.
+        """
+        rels = self.rels
+        if self._indexed != len(rels):
+            # rels was changed directly, index it again.
+            self._relindex = {}
+            for index, rel in enumerate(rels):
+                self._relindex.setdefault(rel, index)
+            self._indexed = len(rels)
+        index = self._relindex.get(target)
+        if index is None:
+            index = self._relindex[target] = len(rels)
+            rels.append(target)
+            self._indexed += 1
+        return 'rId%d' % (_base_rels() + index + 1)
+
+    @property
+    def sectPr(self):
+        """
+        returns the ``sectPr`` (section properties) of the body, created with
+        the letter page size and margins of the template if missing.
+        """
+        sectPr = self.body.find(qname('w', 'sectPr'))
+        if sectPr is None:
+            sectPr = E.sectPr(
+                E.pgSz(w='12240', h='15840'),
+                E.pgMar(top='1440', right='1800', bottom='1440', left='1800',
+                        header='720', footer='720', gutter='0'),
+                E.cols(space='720'),
+                E.docGrid(linePitch='360')
+            )
+            self.body.append(sectPr)
+        return sectPr
 
-        for key in ('title', 'subject', 'creator', 'description'):
-            if key in self.meta:
-                el = etree.SubElement(core, qname('dc', key))
-                el.text = self.meta[key]
-        for key in ('created', 'modified'):
-            if key in self.meta:
-                el = etree.SubElement(core, qname('dcterms', key))
-                el.set(qname('xsi', 'type'), 'dcterms:W3CDTF')
-                el.text = self.meta[key].strftime('%Y-%m-%dT%H:%M:%SZ')
-        return core
+    def page_setup(self, width=None, height=None, orient=None, **margins):
+        """
+        Update the page size and margins of the section, all measured in
+        twentieths of a point.
 
-    def save(self, fp, pretty_print=False):
+        *orient*, if specified, is either ``portrait`` or ``landscape``.
+
+        *margins* are any of ``top``, ``right``, ``bottom``, ``left``,
+        ``header``, ``footer`` and ``gutter``.
         """
-        Serialize all document parts to *fp* (a :func:`.write()`-supporting
-        file-like object) or a pathname.
+        sectPr = self.sectPr
+        pgSz = sectPr.find(qname('w', 'pgSz'))
+        if pgSz is None:
+            pgSz = E.pgSz()
+            _insert_before(sectPr, pgSz, _sect_after_refs[4:])
+        for key, value in (('w', width), ('h', height), ('orient', orient)):
+            if value is not None:
+                pgSz.set(qname('w', key), str(value))
+
+        pgMar = sectPr.find(qname('w', 'pgMar'))
+        if pgMar is None:
+            pgMar = E.pgMar()
+            _insert_before(sectPr, pgMar, _sect_after_refs[5:])
+        for key, value in margins.items():
+            pgMar.set(qname('w', key), str(value))
+
+    def _add_reference(self, part, type):
+        assert type in ('default', 'first', 'even')
+        rid = self.add_relationship(part)
+        sectPr = self.sectPr
+        tag = qname('w', '%sReference' % part.kind)
+        for ref in sectPr.findall(tag):
+            if ref.get(qname('w', 'type')) == type:
+                sectPr.remove(ref)
+        _insert_before(
+            sectPr, E('%sReference' % part.kind, {qname('r', 'id'): rid},
+                      type=type),
+            _sect_after_refs)
+        if type == 'first' and sectPr.find(qname('w', 'titlePg')) is None:
+            _insert_before(sectPr, E.titlePg(), _sect_after_title)
+        return rid
+
+    def add_header(self, part, type='default'):
+        """
+        Reference the header *part* (see :func:`header`) from the section.
 
-        If *pretty_priint* is ``True`` (default: ``False``), then the XML
-        elements will be pretty-printed with indention.
+        *type* is ``default``, ``first`` for the first page, or ``even``
+        for even pages, which requires ``evenAndOddHeaders`` in the
+        settings.
+        """
+        assert part.kind == 'header'
+        return self._add_reference(part, type)
+
+    def add_footer(self, part, type='default'):
+        """
+        Reference the footer *part* (see :func:`footer`) from the section,
+        *type* as in :meth:`add_header`.
+        """
+        assert part.kind == 'footer'
+        return self._add_reference(part, type)
+
+    def get_core_props(self):
+        """
+        returns the core properties as a ``coreProperties`` element.
+        """
+        return etree.fromstring(self.dumps_core_props())
 
+    def dumps_core_props(self):
         """
-        parts = ('[Content_Types].xml',
-                 '_rels/.rels',
-                 'docProps/app.xml',
-                 'word/fontTable.xml',
+        Serialize the core properties, ``docProps/core.xml``, to
+        :class:`bytes`.
+        """
+        meta = self.meta
+        props = ''.join(template % _escape(formatter(meta[key]))
+                        for key, template, formatter in _core_props
+                        if key in meta)
+        return (_core_skeleton % props).encode('utf-8')
+
+    def dumps_app_props(self):
+        """
+        Serialize the extended properties, ``docProps/app.xml``, to
+        :class:`bytes`.
+        """
+        body = self.body
+        size = len(body)
+        last = body[-1] if size else None
+        if size and last.tag == qname('w', 'sectPr'):
+            size -= 1
+            last = last.getprevious()
+        if (size, last) != self._counted:
+            # the body was changed behind append(), count from scratch.
+            for key in self.stats:
+                self.stats[key] = 0
+            for element in body:
+                _count(element, self.stats)
+            self._counted = (size, last)
+        return (_app_skeleton % self.stats).encode('utf-8')
+
+    def dumps_custom_props(self):
+        """
+        Serialize the custom properties, ``docProps/custom.xml``, to
+        :class:`bytes`.
+        """
+        props = []
+        for pid, name in enumerate(sorted(self.custom), 2):
+            vt, text = _custom_value(self.custom[name])
+            props.append(_custom_property % (pid, _escape(name), vt, text, vt))
+        return (_custom_skeleton % ''.join(props)).encode('utf-8')
+
+    def _close_body(self):
+        # the section properties MUST be the last child of the body.
+        sectPr = self.body.find(qname('w', 'sectPr'))
+        if sectPr is not None and sectPr is not self.body[-1]:
+            self.body.append(sectPr)
+
+    def iterparts(self, pretty_print=False, canonical=False):
+        """
+        Generate the ``(name, bytes)`` of all document parts in the
+        package, see :meth:`save`.
+
+        If *canonical* is ``True`` (default: ``False``), the generated XML
+        parts are serialized in the canonical form with sorted attributes.
+        """
+        parts = ('word/fontTable.xml',
                  'word/numbering.xml',
                  'word/settings.xml',
                  'word/styles.xml',
@@ -375,42 +944,154 @@ class Document(object):
                  'word/webSettings.xml',
                  'word/theme/theme1.xml',
                  )
-        with ZipFile(fp, mode='w', compression=zipfile.ZIP_DEFLATED) as zippy:
-            for part in parts:
-                bytes = resource_string(__name__, 'templates/%s' % part)
-                # CODE DEBT: use stream?
-                zippy.writestr(part, bytes)
-
-            # add hyperlinks to the relationship document.xml.rels
-            bytes = resource_string(__name__, 'templates/word/_rels/document.xml.rels')
-            root = etree.fromstring(bytes)
-            currentId = len(list(root))
-            for rel in self.rels:
-                currentId += 1
-                node = H.Relationship()
-                node.set('Id', 'rId' + str(currentId))
+        self._close_body()
+        for part in parts:
+            yield part, _resource_string(part)
+
+        # add hyperlinks and parts to the relationship document.xml.rels
+        bytes = _resource_string('word/_rels/document.xml.rels')
+        root = etree.fromstring(bytes)
+        types = None
+        counts = {}
+        currentId = len(list(root))
+        for rel in self.rels:
+            currentId += 1
+            node = H.Relationship()
+            node.set('Id', 'rId' + str(currentId))
+            if isinstance(rel, Part):
+                counts[rel.kind] = counts.get(rel.kind, 0) + 1
+                name = '%s%d.xml' % (rel.kind, counts[rel.kind])
+                node.set('Target', name)
+                node.set('Type', rel.reltype)
+                yield 'word/' + name, rel.tostring(pretty_print, canonical)
+
+                if types is None:
+                    types = etree.fromstring(
+                        _resource_string('[Content_Types].xml'))
+                override = etree.SubElement(
+                    types, qname('ct', 'Override'))
+                override.set('PartName', '/word/' + name)
+                override.set('ContentType', rel.content_type)
+            else:
                 node.set('Target', rel)
                 node.set('TargetMode', 'External')
                 node.set('Type', 'http://schemas.openxmlformats.org/officeDocument/2006/'
                     'relationships/hyperlink')
-                root.append(node)
-
-            string = etree.tostring(root, xml_declaration=True, standalone=True,
-                encoding='UTF-8', pretty_print=pretty_print)
-            # serialize the document.xml.rels
-            zippy.writestr('word/_rels/document.xml.rels', string)
-
-            # serialize the document.xml
-            zippy.writestr('word/document.xml', etree.tostring(
-                self.doc, xml_declaration=True, standalone=True,
-                encoding='UTF-8', pretty_print=pretty_print))
-
-            # serialize docProps/core.xml
-            zippy.writestr(
-                'docProps/core.xml',
-                etree.tostring(
-                    self.get_core_props(),
-                    pretty_print=pretty_print)
-            )
+            root.append(node)
+
+        # serialize the document.xml.rels
+        yield 'word/_rels/document.xml.rels', _tostring(
+            root, pretty_print, canonical)
+
+        # serialize the package relationships, _rels/.rels
+        if self.custom:
+            rels = etree.fromstring(_resource_string('_rels/.rels'))
+            node = H.Relationship()
+            node.set('Id', 'rId%d' % (len(rels) + 1))
+            node.set('Target', 'docProps/custom.xml')
+            node.set('Type', 'http://schemas.openxmlformats.org/'
+                     'officeDocument/2006/relationships/custom-properties')
+            rels.append(node)
+            yield '_rels/.rels', _tostring(rels, pretty_print, canonical)
+
+            if types is None:
+                types = etree.fromstring(
+                    _resource_string('[Content_Types].xml'))
+            override = etree.SubElement(types, qname('ct', 'Override'))
+            override.set('PartName', '/docProps/custom.xml')
+            override.set('ContentType', 'application/vnd.openxmlformats-'
+                         'officedocument.custom-properties+xml')
+        else:
+            yield '_rels/.rels', _resource_string('_rels/.rels')
+
+        # serialize the [Content_Types].xml
+        if types is None:
+            yield '[Content_Types].xml', _resource_string('[Content_Types].xml')
+        else:
+            yield '[Content_Types].xml', _tostring(
+                types, pretty_print, canonical)
+
+        # serialize the document.xml
+        yield 'word/document.xml', _tostring(
+            self.doc, pretty_print, canonical)
+
+        # serialize docProps/core.xml, app.xml and custom.xml
+        yield 'docProps/core.xml', self.dumps_core_props()
+        yield 'docProps/app.xml', self.dumps_app_props()
+        if self.custom:
+            yield 'docProps/custom.xml', self.dumps_custom_props()
+
+        # TODO: save word/_rels/document.xml.rels if blip is supported
 
-            # TODO: save word/_rels/document.xml.rels if blip is supported
+    def validate(self):
+        """
+        Validate the main document and the referenced headers and footers,
+        see :func:`validate`.
+        """
+        self._close_body()
+        validate(self.doc)
+        for rel in self.rels:
+            if isinstance(rel, Part):
+                validate(rel.root)
+
+    def content_hash(self):
+        """
+        Returns the SHA-256 hex digest of the document parts as serialized
+        by ``save(fp, deterministic=True)``, without compressing them.
+
+        Identical documents have identical hashes, so the digest may key a
+        render cache to skip saving and uploading unchanged documents.
+        """
+        import hashlib
+        digest = hashlib.sha256()
+        for name, bytes in sorted(self.iterparts(canonical=True)):
+            _hash_part(digest, name, bytes)
+        return digest.hexdigest()
+
+    def save(self, fp, pretty_print=False, deterministic=False, workers=1):
+        """
+        Serialize all document parts to *fp* (a :func:`.write()`-supporting
+        file-like object) or a pathname.
+
+        If *pretty_priint* is ``True`` (default: ``False``), then the XML
+        elements will be pretty-printed with indention.
+
+        If *deterministic* is ``True`` (default: ``False``), the same
+        document always produces the same bytes: the zip entries have a
+        fixed timestamp and are sorted by name, and the XML parts are
+        canonicalized. The :meth:`content_hash` of the parts, computed
+        while writing them, is returned in this mode.
+
+        The large parts, ``word/document.xml`` typically, are deflated in
+        blocks by *workers* threads (default: ``1``), see
+        :mod:`docxgen.deflate`. The output does not depend on the number of
+        workers.
+
+        """
+        if _strict:
+            self.validate()
+        parts = self.iterparts(pretty_print, canonical=deterministic)
+        if deterministic:
+            import hashlib
+            digest = hashlib.sha256()
+            parts = sorted(parts)
+
+        with _zipfile(fp, mode='w', compression=_ZIP_DEFLATED) as zippy:
+            for name, bytes in parts:
+                if deterministic:
+                    _hash_part(digest, name, bytes)
+                    info = _zipinfo(name, _zip_epoch)
+                else:
+                    info = name
+
+                if len(bytes) > _parallel_min:
+                    from docxgen import deflate
+                    if not deterministic:
+                        info = _zipinfo(name)
+                    deflate.writestr(zippy, info, bytes, max(workers, 1))
+                else:
+                    # CODE DEBT: use stream?
+                    zippy.writestr(info, bytes)
+
+        if deterministic:
+            return digest.hexdigest()
@@ -0,0 +1,578 @@
+"""
+Convert Markdown and a basic HTML subset to WordprocessingML.
+
+The converters read their input in one pass and append every block, a
+paragraph, a list item or a table, to the :class:`~docxgen.Document` as soon
+as it is complete, so the input is never held as an intermediate tree. The
+elements are built with :func:`lxml.etree.SubElement` rather than the
+:data:`~docxgen.E` builder, which declares every namespace of
+:data:`~docxgen.nsmap` on each new element.
+
+For example::
+
+    from docxgen import Document
+    from docxgen.convert import markdown
+
+    doc = Document()
+    with open('README.md') as f:
+        markdown(f, doc)
+    doc.save('README.docx')
+
+Every numbered list uses the one numbering definition of the document
+template, so the numbers of separate lists run on rather than restart at
+one.
+"""
+import re
+from lxml import etree
+from six import string_types, unichr
+from six.moves.html_entities import name2codepoint
+from six.moves.html_parser import HTMLParser
+
+from docxgen import Document, nsmap, qname, _illegal_chars
+
+_nsmap = {'w': nsmap['w'], 'r': nsmap['r']}
+
+_P, _PPR, _PSTYLE = qname('w', 'p'), qname('w', 'pPr'), qname('w', 'pStyle')
+_NUMPR, _ILVL, _NUMID = (qname('w', 'numPr'), qname('w', 'ilvl'),
+                         qname('w', 'numId'))
+_IND = qname('w', 'ind')
+_R, _RPR, _T, _BR = (qname('w', 'r'), qname('w', 'rPr'), qname('w', 't'),
+                     qname('w', 'br'))
+_RSTYLE, _RFONTS, _B, _I, _COLOR, _U = (
+    qname('w', 'rStyle'), qname('w', 'rFonts'), qname('w', 'b'),
+    qname('w', 'i'), qname('w', 'color'), qname('w', 'u'))
+_HYPERLINK, _RID = qname('w', 'hyperlink'), qname('r', 'id')
+_TBL, _TBLPR, _TBLSTYLE, _TBLW, _TBLGRID, _GRIDCOL = (
+    qname('w', 'tbl'), qname('w', 'tblPr'), qname('w', 'tblStyle'),
+    qname('w', 'tblW'), qname('w', 'tblGrid'), qname('w', 'gridCol'))
+_TR, _TRPR, _TBLHEADER, _TC = (qname('w', 'tr'), qname('w', 'trPr'),
+                               qname('w', 'tblHeader'), qname('w', 'tc'))
+_VAL, _TYPE, _W = qname('w', 'val'), qname('w', 'type'), qname('w', 'w')
+_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+_illegal = re.compile(_illegal_chars)
+
+# run styles, combined as bit flags
+BOLD, ITALIC, UNDERLINE, CODE, LINK = 1, 2, 4, 8, 16
+
+# paragraph kinds -> (pStyle, numId), see li()
+_kinds = {
+    'h1': ('Heading1', None),
+    'h2': ('Heading2', None),
+    'h3': ('Heading3', None),
+    'disc': ('ListParagraph', '3'),
+    'number': ('ListParagraph', '2'),
+}
+
+
+def _paragraph(kind=None):
+    '''returns a standalone ``p`` element of *kind*.'''
+    p = etree.Element(_P, nsmap=_nsmap)
+    if kind is None:
+        return p
+    pPr = etree.SubElement(p, _PPR)
+    if kind == 'quote':
+        etree.SubElement(pPr, _IND).set(qname('w', 'left'), '720')
+        return p
+    style, numId = _kinds[kind]
+    etree.SubElement(pPr, _PSTYLE).set(_VAL, style)
+    if numId is not None:
+        numPr = etree.SubElement(pPr, _NUMPR)
+        etree.SubElement(numPr, _ILVL).set(_VAL, '0')
+        etree.SubElement(numPr, _NUMID).set(_VAL, numId)
+    return p
+
+
+def _run(parent, text, style):
+    '''append a ``r`` element of *text* in *style* to *parent*.'''
+    # drop the characters XML does not allow rather than fail on them.
+    text = _illegal.sub('', text)
+    r = etree.SubElement(parent, _R)
+    if style:
+        # the rPr children are ordered by the schema.
+        rPr = etree.SubElement(r, _RPR)
+        if style & LINK:
+            etree.SubElement(rPr, _RSTYLE).set(_VAL, 'Hyperlink')
+        if style & CODE:
+            fonts = etree.SubElement(rPr, _RFONTS)
+            fonts.set(qname('w', 'ascii'), 'Courier New')
+            fonts.set(qname('w', 'hAnsi'), 'Courier New')
+        if style & BOLD:
+            etree.SubElement(rPr, _B)
+        if style & ITALIC:
+            etree.SubElement(rPr, _I)
+        if style & LINK:
+            etree.SubElement(rPr, _COLOR).set(_VAL, '0000FF')
+        if style & (UNDERLINE | LINK):
+            etree.SubElement(rPr, _U).set(_VAL, 'single')
+    t = etree.SubElement(r, _T)
+    t.text = text
+    if text[:1].isspace() or text[-1:].isspace():
+        t.set(_SPACE, 'preserve')
+    return r
+
+
+def _break(parent):
+    etree.SubElement(etree.SubElement(parent, _R), _BR)
+
+
+def _hyperlink(parent, doc, url):
+    link = etree.SubElement(parent, _HYPERLINK)
+    link.set(_RID, doc.add_relationship(url))
+    return link
+
+
+def _table(rows, header):
+    '''returns a ``tbl`` element of *rows*, lists of ``p`` elements.'''
+    tbl = etree.Element(_TBL, nsmap=_nsmap)
+    tblPr = etree.SubElement(tbl, _TBLPR)
+    etree.SubElement(tblPr, _TBLSTYLE).set(_VAL, 'LightShading-Accent1')
+    tblW = etree.SubElement(tblPr, _TBLW)
+    tblW.set(_W, '0')
+    tblW.set(_TYPE, 'auto')
+    columns = max(len(row) for row in rows)
+    grid = etree.SubElement(tbl, _TBLGRID)
+    for i in range(columns):
+        etree.SubElement(grid, _GRIDCOL)
+    for index, row in enumerate(rows):
+        tr = etree.SubElement(tbl, _TR)
+        if index < header:
+            etree.SubElement(etree.SubElement(tr, _TRPR), _TBLHEADER)
+        # pad the short rows, every tc MUST contain a paragraph.
+        row = row + [None] * (columns - len(row))
+        for p in row:
+            tc = etree.SubElement(tr, _TC)
+            tc.append(p if p is not None else etree.Element(_P))
+    return tbl
+
+
+def _lines(source):
+    if isinstance(source, string_types):
+        return source.splitlines()
+    return (line.rstrip('\r\n') for line in source)
+
+
+# Markdown
+
+_inline = re.compile(r'''
+    \\(?P<escape>[\\`*_{}\[\]()#+\-.!|>~])
+  | (?P<ticks>`+)(?P<code>.+?)(?P=ticks)
+  | \[(?P<text>[^\]]*)\]\((?P<url>[^)\s]+)(?:\s+"[^"]*")?\)
+  | <(?P<autolink>(?:https?|ftp|mailto):[^>\s]+)>
+  | (?P<strong>\*\*|__)
+  | (?P<em>\*|(?<!\w)_|_(?!\w))
+  | (?P<newline>\n)
+''', re.X)
+
+_heading = re.compile(r'(#{1,6})\s+(.*?)(?:\s+#+)?\s*$')
+_item = re.compile(r'\s*(?:([-*+])|\d{1,9}[.)])\s+(.*)$')
+_fence = re.compile(r'\s*(`{3,}|~{3,})')
+_rule = re.compile(r'\s*([-*_])(?:\s*\1){2,}\s*$')
+_separator = re.compile(r'\s*\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?\s*$')
+_cell = re.compile(r'(?<!\\)\|')
+_closers = dict((marker, re.compile(r'(?<![\\\s])' + re.escape(marker)))
+                for marker in ('**', '__', '*', '_'))
+
+
+def _markdown_inline(parent, text, doc, style=0):
+    '''append the runs and hyperlinks of the inline Markdown *text* to
+    *parent*.'''
+    pos = 0
+    buf = []
+    for m in _inline.finditer(text):
+        # the last group matched: escape, code, url, autolink, strong, em
+        # or newline.
+        kind = m.lastgroup
+        if kind in ('strong', 'em'):
+            marker = m.group(kind)
+            bit = BOLD if kind == 'strong' else ITALIC
+            # an emphasis marker opens only if followed by text and closed
+            # later, otherwise it is literal text.
+            if not style & bit and (
+                    text[m.end():m.end() + 1].isspace() or
+                    not _closers[marker].search(text, m.end() + 1)):
+                continue
+        buf.append(text[pos:m.start()])
+        pos = m.end()
+        if kind == 'escape':
+            buf.append(m.group('escape'))
+            continue
+
+        if buf:
+            chunk = ''.join(buf)
+            if chunk:
+                _run(parent, chunk, style)
+            buf = []
+        if kind in ('strong', 'em'):
+            style ^= bit
+        elif kind == 'code':
+            _run(parent, m.group('code').strip(), style | CODE)
+        elif kind == 'url':
+            link = _hyperlink(parent, doc, m.group('url'))
+            _markdown_inline(link, m.group('text'), doc, style | LINK)
+        elif kind == 'autolink':
+            url = m.group('autolink')
+            _run(_hyperlink(parent, doc, url), url, style | LINK)
+        elif kind == 'newline':
+            _break(parent)
+    buf.append(text[pos:])
+    chunk = ''.join(buf)
+    if chunk:
+        _run(parent, chunk, style)
+
+
+def _cells(line):
+    line = line.strip()
+    if line.startswith('|'):
+        line = line[1:]
+    if line.endswith('|') and not line.endswith('\\|'):
+        line = line[:-1]
+    return [cell.strip() for cell in _cell.split(line)]
+
+
+def markdown(source, doc=None):
+    """
+    Convert the Markdown *source*, a string or an iterable of lines such as
+    a file object, and append it to *doc* (default: a new
+    :class:`~docxgen.Document`), returns the document.
+
+    Supported are ATX and setext headings, paragraphs with hard line breaks,
+    bulleted and numbered list items, block quotes, fenced code blocks,
+    pipe tables, ``**bold**``, ``*italic*``, ```code```, links and
+    autolinks. Nested lists are flattened. The characters XML does not
+    allow, most control characters, are dropped.
+    """
+    doc = doc or Document()
+    append = doc.append
+    lines = []  # the pending paragraph
+    kind = None
+    rows = []  # the pending table
+    fence = None
+
+    def flush():
+        if lines:
+            p = _paragraph(kind)
+            # a line ending with two spaces is a hard line break.
+            text = ''.join(
+                line.rstrip() + ('\n' if line.endswith('  ') else ' ')
+                for line in lines)
+            _markdown_inline(p, text.strip(), doc)
+            append(p)
+            del lines[:]
+
+    def cells(line):
+        row = []
+        for cell in _cells(line):
+            p = _paragraph()
+            _markdown_inline(p, cell, doc)
+            row.append(p)
+        return row
+
+    for line in _lines(source):
+        if fence is not None:
+            if line.strip().startswith(fence):
+                fence = None
+            else:
+                p = _paragraph()
+                if line:
+                    _run(p, line, CODE)
+                append(p)
+            continue
+
+        if rows:
+            if '|' in line:
+                rows.append(cells(line))
+                continue
+            append(_table(rows, 1))
+            rows = []
+
+        stripped = line.strip()
+        if not stripped:
+            flush()
+            kind = None
+            continue
+
+        m = _fence.match(line)
+        if m:
+            flush()
+            kind = None
+            fence = m.group(1)
+            continue
+
+        m = _heading.match(stripped)
+        if m:
+            flush()
+            kind = 'h%d' % min(len(m.group(1)), 3)
+            lines.append(m.group(2))
+            flush()
+            kind = None
+            continue
+
+        if len(lines) == 1 and kind is None and '|' in lines[0] and \
+                '-' in stripped and _separator.match(stripped) and \
+                len(_cells(stripped)) == len(_cells(lines[0])):
+            # the pending line is the header row of a table
+            rows = [cells(lines.pop())]
+            continue
+
+        if lines and kind is None and stripped.strip('=') == '':
+            kind = 'h1'
+            flush()
+            kind = None
+            continue
+        if lines and kind is None and stripped.strip('-') == '':
+            kind = 'h2'
+            flush()
+            kind = None
+            continue
+
+        if _rule.match(stripped):
+            flush()
+            kind = None
+            continue
+
+        m = _item.match(line)
+        if m:
+            flush()
+            kind = 'disc' if m.group(1) else 'number'
+            lines.append(m.group(2))
+            continue
+
+        if stripped.startswith('>'):
+            if kind != 'quote':
+                flush()
+                kind = 'quote'
+            lines.append(stripped.lstrip('>').strip())
+            continue
+
+        if kind == 'quote':
+            flush()
+            kind = None
+        lines.append(line.lstrip())
+
+    flush()
+    if rows:
+        append(_table(rows, 1))
+    return doc
+
+
+# HTML
+
+_whitespace = re.compile(r'\s+')
+_html_styles = {
+    'b': BOLD, 'strong': BOLD,
+    'i': ITALIC, 'em': ITALIC, 'cite': ITALIC,
+    'u': UNDERLINE, 'ins': UNDERLINE,
+    'code': CODE, 'tt': CODE, 'kbd': CODE, 'samp': CODE,
+}
+_html_blocks = ('p', 'div', 'blockquote', 'pre', 'li', 'h1', 'h2', 'h3',
+                'h4', 'h5', 'h6', 'ul', 'ol', 'section', 'article', 'header',
+                'footer', 'hr')
+
+
+class _HTMLConverter(HTMLParser):
+
+    def __init__(self, doc):
+        try:
+            HTMLParser.__init__(self, convert_charrefs=True)
+        except TypeError:
+            HTMLParser.__init__(self)
+        self.doc = doc
+        self.p = None  # the pending paragraph, or table cell
+        self.empty = True  # no text in p yet
+        self.parent = None  # p, or the hyperlink in p
+        self.kind = None
+        self.styles = dict((bit, 0) for bit in _html_styles.values())
+        self.style = 0
+        self.lists = []
+        self.pre = 0
+        self.pre_start = False  # no line in pre yet
+        self.skip = 0  # inside script or style
+        self.rows = None  # the pending table
+        self.heads = None  # whether each row of the table is a header row
+        self.thead = False
+        self.tables = 0  # table nesting depth
+
+    def paragraph(self):
+        if self.p is None:
+            self.p = self.parent = _paragraph(self.kind)
+            self.empty = True
+        return self.parent
+
+    def flush(self):
+        if self.p is not None and self.rows is None:
+            self.doc.append(self.p)
+        self.p = self.parent = None
+
+    def table(self):
+        '''append the pending table, its leading header rows repeated.'''
+        header = 0
+        rows = []
+        for row, head in zip(self.rows, self.heads):
+            if not row:
+                continue
+            if head and header == len(rows):
+                header += 1
+            rows.append(row)
+        self.rows = self.heads = None
+        self.p = self.parent = None
+        if rows:
+            self.doc.append(_table(rows, header))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _html_styles:
+            bit = _html_styles[tag]
+            self.styles[bit] += 1
+            self.style |= bit
+        elif tag in ('script', 'style'):
+            self.skip += 1
+        elif tag == 'br':
+            _break(self.paragraph())
+        elif tag == 'a':
+            href = dict(attrs).get('href')
+            if href:
+                self.parent = _hyperlink(self.paragraph(), self.doc, href)
+                self.style |= LINK
+        elif tag == 'table':
+            self.tables += 1
+            if self.tables == 1:
+                self.flush()
+                self.rows = []
+                self.heads = []
+                self.thead = False
+        elif self.rows is not None:
+            if self.tables > 1:
+                return
+            if tag == 'thead':
+                self.thead = True
+            elif tag == 'tr':
+                self.rows.append([])
+                self.heads.append(True)
+            elif tag in ('td', 'th'):
+                if not self.rows:
+                    self.rows.append([])
+                    self.heads.append(True)
+                self.p = None
+                self.kind = None
+                cell = self.paragraph()
+                self.rows[-1].append(cell)
+                # a header row is in thead or has th cells only.
+                if tag == 'td' and not self.thead:
+                    self.heads[-1] = False
+        elif tag in _html_blocks:
+            self.flush()
+            if tag in ('ul', 'ol'):
+                self.lists.append('disc' if tag == 'ul' else 'number')
+            elif tag == 'li':
+                self.kind = self.lists[-1] if self.lists else 'disc'
+            elif tag[0] == 'h' and tag[1:].isdigit():
+                self.kind = 'h%d' % min(int(tag[1]), 3)
+            elif tag == 'blockquote':
+                self.kind = 'quote'
+            elif tag == 'pre':
+                self.pre += 1
+                self.pre_start = True
+
+    def handle_endtag(self, tag):
+        if tag in _html_styles:
+            bit = _html_styles[tag]
+            if self.styles[bit]:
+                self.styles[bit] -= 1
+                if not self.styles[bit]:
+                    self.style &= ~bit
+        elif tag in ('script', 'style'):
+            self.skip = max(self.skip - 1, 0)
+        elif tag == 'a':
+            if self.p is not None:
+                self.parent = self.p
+            self.style &= ~LINK
+        elif tag == 'table':
+            self.tables = max(self.tables - 1, 0)
+            if not self.tables and self.rows is not None:
+                self.table()
+        elif self.rows is not None:
+            if self.tables == 1 and tag in ('td', 'th'):
+                self.p = self.parent = None
+            elif self.tables == 1 and tag == 'thead':
+                self.thead = False
+        elif tag in _html_blocks:
+            self.flush()
+            if tag in ('ul', 'ol') and self.lists:
+                self.lists.pop()
+            elif tag == 'pre':
+                self.pre = max(self.pre - 1, 0)
+            if self.kind == 'quote' and tag != 'blockquote':
+                return
+            self.kind = None
+
+    def handle_data(self, data):
+        if self.skip:
+            return
+        style = self.style
+        if self.pre:
+            lines = data.split('\n')
+            for index, line in enumerate(lines):
+                if index:
+                    # a blank line is an empty paragraph, but for a newline
+                    # right after the pre tag.
+                    if self.p is None and not self.pre_start:
+                        self.paragraph()
+                    self.flush()
+                    self.pre_start = False
+                if line:
+                    _run(self.paragraph(), line, style | CODE)
+                    self.pre_start = False
+            return
+        data = _whitespace.sub(' ', data)
+        if self.p is None or self.empty:
+            data = data.lstrip()
+        if data:
+            _run(self.paragraph(), data, style)
+            self.empty = False
+
+    # the references in data, unless the parser converts them.
+
+    def handle_entityref(self, name):
+        if name in name2codepoint:
+            self.handle_data(unichr(name2codepoint[name]))
+        else:
+            self.handle_data('&%s;' % name)
+
+    def handle_charref(self, name):
+        try:
+            if name[:1] in ('x', 'X'):
+                char = unichr(int(name[1:], 16))
+            else:
+                char = unichr(int(name))
+        except (ValueError, OverflowError):
+            char = unichr(0xfffd)
+        self.handle_data(char)
+
+    def close(self):
+        HTMLParser.close(self)
+        self.flush()
+        if self.rows:
+            self.table()
+
+
+def html(source, doc=None):
+    """
+    Convert the HTML *source*, a string or an iterable of chunks such as a
+    file object, and append it to *doc* (default: a new
+    :class:`~docxgen.Document`), returns the document.
+
+    Supported are the ``p``, ``div``, ``h1`` to ``h6``, ``ul``, ``ol``,
+    ``li``, ``blockquote``, ``pre``, ``br``, ``a``, ``table``, ``tr``,
+    ``th`` and ``td`` elements, and ``b``, ``strong``, ``i``, ``em``,
+    ``u`` and ``code`` for the run styles. Other elements contribute their
+    text only; nested tables are flattened into the outer table. The
+    characters XML does not allow, most control characters, are dropped.
+    """
+    doc = doc or Document()
+    parser = _HTMLConverter(doc)
+    if isinstance(source, string_types):
+        parser.feed(source)
+    else:
+        for chunk in source:
+            parser.feed(chunk)
+    parser.close()
+    return doc
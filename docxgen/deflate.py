@@ -0,0 +1,157 @@
+"""
+Parallel deflate, in the fashion of pigz_.
+
+The data is split in blocks compressed on a thread pool, :mod:`zlib` releases
+the GIL while compressing. Every block but the last ends with a sync flush,
+which byte-aligns the output without ending the stream, so the compressed
+blocks concatenate into one raw deflate stream. Each block is primed with the
+last 32K of its predecessor to keep the compression ratio close to a serial
+deflate, and the CRC32 of the blocks are combined as in ``crc32_combine()``
+of zlib.
+
+.. _pigz: http://zlib.net/pigz/
+"""
+import zlib
+
+BLOCKSIZE = 1 << 20
+WINDOW = 1 << 15  # the deflate history window
+
+
+def _gf2_matrix_times(mat, vec):
+    s = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            s ^= mat[i]
+        vec >>= 1
+        i += 1
+    return s
+
+
+def _gf2_matrix_square(mat):
+    return [_gf2_matrix_times(mat, mat[n]) for n in range(32)]
+
+
+def crc32_shift(length):
+    """
+    Returns the operator, a GF(2) 32x32 matrix, appending *length* zero
+    bytes to a CRC32, see :func:`crc32_combine`.
+    """
+    # operator for one zero bit
+    odd = [0xedb88320] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)  # two zero bits
+    odd = _gf2_matrix_square(even)  # four zero bits
+    # identity
+    op = [1 << n for n in range(32)]
+    while length:
+        # apply the operators for the set bits of the byte count.
+        even = _gf2_matrix_square(odd)
+        if length & 1:
+            op = [_gf2_matrix_times(even, row) for row in op]
+        length >>= 1
+        if not length:
+            break
+        odd = _gf2_matrix_square(even)
+        if length & 1:
+            op = [_gf2_matrix_times(odd, row) for row in op]
+        length >>= 1
+    return op
+
+
+def crc32_combine(crc1, crc2, length2, shift=None):
+    """
+    Returns the CRC32 of two concatenated blocks, given *crc1* of the first,
+    *crc2* and *length2* of the second block.
+
+    *shift*, if specified, MUST be ``crc32_shift(length2)``, precomputed
+    to combine many blocks of the same length.
+    """
+    if length2 <= 0:
+        return crc1
+    if shift is None:
+        shift = crc32_shift(length2)
+    return _gf2_matrix_times(shift, crc1) ^ crc2
+
+
+def _compress_block(data, start, end, last, level):
+    block = data[start:end]
+    if start:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY,
+                                      data[max(0, start - WINDOW):start])
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(block) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return deflated, zlib.crc32(block) & 0xffffffff
+
+
+def compress(data, workers=4, blocksize=BLOCKSIZE,
+             level=zlib.Z_DEFAULT_COMPRESSION):
+    """
+    Deflate *data* with *workers* threads, returns the raw deflate stream
+    (as stored in zip entries) and the CRC32 of *data*.
+    """
+    data = memoryview(data)
+    size = len(data)
+    starts = list(range(0, size, blocksize)) or [0]
+
+    def task(start):
+        end = min(start + blocksize, size)
+        return _compress_block(data, start, end, end == size, level)
+
+    if workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(workers) as executor:
+            blocks = list(executor.map(task, starts))
+    else:
+        blocks = list(map(task, starts))
+
+    shift = crc32_shift(blocksize)
+    crc = blocks[0][1]
+    for start, (_, block_crc) in zip(starts[1:], blocks[1:]):
+        length = min(blocksize, size - start)
+        crc = crc32_combine(crc, block_crc, length,
+                            shift if length == blocksize else None)
+    return b''.join(deflated for deflated, _ in blocks), crc
+
+
+def writestr(zippy, zinfo, data, workers=4, blocksize=BLOCKSIZE):
+    """
+    Write *data* as the deflated entry *zinfo*, a :class:`zipfile.ZipInfo`,
+    of the :class:`zipfile.ZipFile` *zippy*, compressed by :func:`compress`.
+
+    :mod:`zipfile` has no interface for precompressed data, the entry is
+    written the way :meth:`zipfile.ZipFile.writestr` does; on Python
+    releases with a different :mod:`zipfile` layout *data* is compressed
+    serially by :meth:`~zipfile.ZipFile.writestr` instead.
+    """
+    import zipfile
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    if not all(hasattr(zippy, attr) for attr in (
+            'start_dir', '_lock', '_seekable', '_writecheck', '_writing')):
+        return zippy.writestr(zinfo, data)
+
+    deflated, crc = compress(data, workers, blocksize)
+    zinfo.file_size = len(data)
+    zinfo.compress_size = len(deflated)
+    zinfo.CRC = crc
+    zinfo.flag_bits = 0x00
+    if not zinfo.external_attr:
+        zinfo.external_attr = 0o600 << 16  # permissions: ?rw-------
+    zip64 = max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT
+
+    with zippy._lock:
+        if zippy._writing:
+            raise ValueError("Can't write to the ZIP file while there is "
+                             "another write handle open on it.")
+        if zippy._seekable:
+            zippy.fp.seek(zippy.start_dir)
+        zinfo.header_offset = zippy.fp.tell()
+        zippy._writecheck(zinfo)
+        zippy._didModify = True
+        zippy.fp.write(zinfo.FileHeader(zip64))
+        zippy.fp.write(deflated)
+        zippy.start_dir = zippy.fp.tell()
+        zippy.filelist.append(zinfo)
+        zippy.NameToInfo[zinfo.filename] = zinfo
@@ -0,0 +1,169 @@
+from io import BytesIO, StringIO
+import six
+from zipfile import ZipFile
+from lxml import etree
+from docxgen import *
+from docxgen import nsmap
+from docxgen.convert import markdown, html, _HTMLConverter
+from . import check_tag
+
+def styles(root):
+    return [el.get(qname('w', 'val')) for el in
+            root.iterfind('.//w:pStyle', namespaces=nsmap)]
+
+def test_markdown_inline():
+    doc = markdown('Some **bold**, *italic* and `code` in a '
+                   '[link](http://example.com/) 2 * 3 \\*star\\*.')
+    p = doc.body[0]
+    check_tag(p, '''p r t r rPr b t r t r rPr i t r t r rPr rFonts t
+    r t hyperlink r rPr rStyle color u t r t'''.split())
+    assert ''.join(p.itertext()) == \
+        'Some bold, italic and code in a link 2 * 3 *star*.'
+    link = p.find('w:hyperlink', namespaces=nsmap)
+    assert doc.rels == ['http://example.com/']
+    assert link.get(qname('r', 'id')) == doc.add_relationship(
+        'http://example.com/')
+    validate(doc.doc)
+
+def test_markdown_blocks():
+    doc = markdown(StringIO(six.u('''# Heading
+
+Setext
+======
+
+A paragraph
+over two lines with a hard  
+break.
+
+- one
+- two
+1. first
+
+> quoted
+
+```
+def f():
+    return 1
+```
+
+| Name | Value |
+|------|------:|
+| a    | 1     |
+''')))
+    body = doc.body
+    assert [etree.QName(el).localname for el in body] == \
+        ['p'] * 9 + ['tbl']
+    assert styles(doc.doc) == ['Heading1', 'Heading1'] + \
+        ['ListParagraph'] * 3
+    assert ''.join(body[2].itertext()) == \
+        'A paragraph over two lines with a hardbreak.'
+    assert body[2].find('.//w:br', namespaces=nsmap) is not None
+    numIds = [el.get(qname('w', 'val')) for el in
+              doc.doc.iterfind('.//w:numId', namespaces=nsmap)]
+    assert numIds == ['3', '3', '2']
+    assert ''.join(body[8].itertext()) == '    return 1'
+
+    tbl = body[-1]
+    check_tag(tbl, '''tbl tblPr tblStyle tblW tblGrid gridCol gridCol
+    tr trPr tblHeader tc p r t tc p r t tr tc p r t tc p r t'''.split())
+    assert doc.stats['paragraphs'] == 13
+    validate(doc.doc)
+
+def test_markdown_table_separator():
+    # the separator has one cell, the line is a setext heading
+    doc = markdown('Revenue | Costs\n---')
+    assert doc.body.find('w:tbl', namespaces=nsmap) is None
+    assert styles(doc.doc) == ['Heading2']
+    assert ''.join(doc.body[0].itertext()) == 'Revenue | Costs'
+
+    doc = markdown('Revenue | Costs\n--- | ---\n1 | 2')
+    assert len(doc.body.findall('w:tbl/w:tr', namespaces=nsmap)) == 2
+
+def test_html():
+    doc = html('''<h2>Fish &amp; Chips</h2>
+<p>Some <b>bold <i>and italic</i></b> text,
+   a <a href="http://example.com/">link</a><br>and a break.</p>
+<ul><li>one</li><li>two</li></ul>
+<ol><li>first</li></ol>
+<pre>def f():
+    return 1</pre>
+<table>
+  <tr><th>Name</th><th>Value</th></tr>
+  <tr><td>a</td><td><p>1</p></td></tr>
+</table>
+<script>ignored()</script>
+<p>tail</p>''')
+    body = doc.body
+    assert [''.join(el.itertext()) for el in body] == [
+        'Fish & Chips',
+        'Some bold and italic text, a linkand a break.',
+        'one', 'two', 'first', 'def f():', '    return 1',
+        'NameValuea1', 'tail']
+    assert styles(doc.doc) == ['Heading2'] + ['ListParagraph'] * 3
+    check_tag(body[1], 'p r t r rPr b t r rPr b i t r t hyperlink r'.split())
+    assert body[1].find('.//w:br', namespaces=nsmap) is not None
+    assert doc.rels == ['http://example.com/']
+    assert len(body[7].findall('.//w:tblHeader', namespaces=nsmap)) == 1
+    validate(doc.doc)
+
+def test_html_table_header():
+    def headers(source):
+        tbl = html(source).body[0]
+        return [row.find('w:trPr/w:tblHeader', namespaces=nsmap) is not None
+                for row in tbl.iterfind('w:tr', namespaces=nsmap)]
+
+    # row labels in th cells do not make header rows
+    assert headers('<table><tr><th>Metric</th><th>Q1</th></tr>'
+                   '<tr><th>Revenue</th><td>1</td></tr>'
+                   '<tr><th>Costs</th><td>2</td></tr></table>') == [
+        True, False, False]
+    assert headers('<table><thead><tr><td>Metric</td><td>Q1</td></tr>'
+                   '</thead><tbody><tr><th>Revenue</th><th>1</th></tr>'
+                   '</tbody></table>') == [True, True]
+    # only the leading rows are header rows
+    assert headers('<table><tr><td>a</td></tr><tr><th>b</th></tr>'
+                   '</table>') == [False, False]
+
+def test_html_self_closing():
+    for tag in ('<script src="a.js"/>', '<table/>', '<b/>', '<ul/>'):
+        doc = html(tag + '<p>kept</p><br/>')
+        assert [''.join(el.itertext()) for el in doc.body] == ['kept', '']
+        check_tag(doc.body[0], 'p r t'.split())
+        assert doc.body[1].find('.//w:br', namespaces=nsmap) is not None
+
+def test_html_pre():
+    doc = html('<pre>\nfirst\n\n  third\n</pre>')
+    assert [''.join(el.itertext()) for el in doc.body] == [
+        'first', '', '  third']
+    validate(doc.doc)
+
+def test_html_references():
+    doc = Document()
+    # as HTMLParser of Python 2, which does not convert the references
+    parser = _HTMLConverter(doc)
+    parser.convert_charrefs = False
+    parser.feed('<p>Fish &amp; Chips &#233;&#x263A; &bogus;</p>')
+    parser.close()
+    assert ''.join(doc.body[0].itertext()) == \
+        six.u('Fish & Chips \xe9\u263a &bogus;')
+
+def test_illegal_chars():
+    doc = html('<p>bad\x01char &#1;</p>')
+    assert ''.join(doc.body[0].itertext()) == 'badchar '
+    doc = markdown('bad\x01char `co\x00de`')
+    assert ''.join(doc.body[0].itertext()) == 'badchar code'
+    validate(doc.doc)
+
+def test_save():
+    doc = Document()
+    markdown('# Title\n\nA [link](http://example.com/).', doc)
+    html(['<p>chunked ', 'input</p>'], doc)
+    tmp = BytesIO()
+    doc.save(tmp)
+    with ZipFile(tmp) as zippy:
+        assert(zippy.testzip() is None)
+        rels = etree.parse(zippy.open('word/_rels/document.xml.rels'))
+        assert 'http://example.com/' in [
+            el.get('Target') for el in rels.getroot()]
+        root = etree.parse(zippy.open('word/document.xml'))
+        assert ''.join(root.getroot()[0][-1].itertext()) == 'chunked input'
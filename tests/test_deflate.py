@@ -0,0 +1,91 @@
+import os
+import zlib
+from io import BytesIO
+from zipfile import ZipFile, ZipInfo
+from lxml import etree
+import docxgen
+from docxgen import *
+from docxgen import deflate
+from . import check_tag
+
+DATA = b''.join(b'<w:p><w:r><w:t>Row %d</w:t></w:r></w:p>' % i
+                for i in range(20000))
+
+def test_crc32_combine():
+    a, b = os.urandom(1000), os.urandom(777)
+    crc = deflate.crc32_combine(zlib.crc32(a), zlib.crc32(b), len(b))
+    assert crc == zlib.crc32(a + b) & 0xffffffff
+    assert deflate.crc32_combine(zlib.crc32(a), 0, 0) == zlib.crc32(a)
+
+def test_compress():
+    for workers in (1, 4):
+        deflated, crc = deflate.compress(DATA, workers, blocksize=1 << 16)
+        assert zlib.decompress(deflated, -zlib.MAX_WBITS) == DATA
+        assert crc == zlib.crc32(DATA) & 0xffffffff
+    # the output does not depend on the number of workers
+    assert deflate.compress(DATA, 1, 1 << 16) == \
+        deflate.compress(DATA, 3, 1 << 16)
+
+    deflated, crc = deflate.compress(b'', 2)
+    assert zlib.decompress(deflated, -zlib.MAX_WBITS) == b''
+    assert crc == 0
+
+def test_writestr():
+    tmp = BytesIO()
+    with ZipFile(tmp, 'w') as zippy:
+        zippy.writestr('before.txt', b'before')
+        deflate.writestr(zippy, ZipInfo('word/document.xml'), DATA, 4,
+                         blocksize=1 << 16)
+        zippy.writestr('after.txt', b'after')
+
+    with ZipFile(tmp) as zippy:
+        assert(zippy.testzip() is None)
+        assert zippy.read('word/document.xml') == DATA
+        assert zippy.read('after.txt') == b'after'
+
+def test_writestr_fallback():
+    class Zippy(object):
+        '''a zip file without the zipfile internals writestr relies on.'''
+        def __init__(self, zippy):
+            self.zippy = zippy
+            self.written = []
+
+        def writestr(self, zinfo, data):
+            self.written.append(zinfo.filename)
+            self.zippy.writestr(zinfo, data)
+
+    tmp = BytesIO()
+    with ZipFile(tmp, 'w') as zippy:
+        wrapper = Zippy(zippy)
+        deflate.writestr(wrapper, ZipInfo('word/document.xml'), DATA, 4)
+        assert wrapper.written == ['word/document.xml']
+
+    with ZipFile(tmp) as zippy:
+        assert(zippy.testzip() is None)
+        assert zippy.getinfo('word/document.xml').compress_type == \
+            zlib.DEFLATED
+        assert zippy.read('word/document.xml') == DATA
+
+def test_save_parallel():
+    doc = Document()
+    for i in range(100):
+        doc.append(paragraph([run('Row %d' % i)]))
+
+    size, docxgen._parallel_min = docxgen._parallel_min, 0
+    try:
+        blobs = []
+        for workers in (1, 2, 4):
+            tmp = BytesIO()
+            doc.save(tmp, deterministic=True, workers=workers)
+            blobs.append(tmp.getvalue())
+        tmp = BytesIO()
+        doc.save(tmp, workers=4)
+    finally:
+        docxgen._parallel_min = size
+
+    assert blobs[0] == blobs[1] == blobs[2]
+    with ZipFile(tmp) as zippy:
+        assert(zippy.testzip() is None)
+        root = etree.parse(zippy.open('word/document.xml'))
+        check_tag(root, 'document body p r t'.split())
+        assert len(root.getroot()[0]) == 100
@@ -3,7 +3,7 @@ from zipfile import ZipFile
 from io import BytesIO
 from lxml import etree
 from docxgen import *
-from docxgen import nsmap
+from docxgen import nsmap, E
 from . import check_tag
 
 def test_init():
@@ -44,6 +44,64 @@ def test_dumps():
     doc = Document()
     assert doc.dumps()
 
+def test_header_footer():
+    hdr = header(paragraph([run('ACME Corp.')]))
+    ftr = footer(paragraph([run('Page '), pagenumber()]))
+
+    blobs = []
+    for i in range(2):
+        doc = Document()
+        doc.add_header(hdr)
+        doc.add_header(hdr, 'first')
+        doc.add_footer(ftr)
+        doc.body.append(paragraph([run('Body')]))
+        tmp = BytesIO()
+        doc.save(tmp)
+
+        with ZipFile(tmp) as zippy:
+            assert(zippy.testzip() is None)
+            names = zippy.namelist()
+            assert 'word/header1.xml' in names
+            assert 'word/footer1.xml' in names
+            assert 'word/header2.xml' not in names
+            blobs.append(zippy.read('word/header1.xml'))
+
+            types = etree.parse(zippy.open('[Content_Types].xml'))
+            parts = [el.get('PartName') for el in types.getroot()]
+            assert '/word/header1.xml' in parts
+            assert '/word/footer1.xml' in parts
+
+            rels = etree.parse(zippy.open('word/_rels/document.xml.rels'))
+            targets = dict((el.get('Id'), el.get('Target'))
+                           for el in rels.getroot())
+
+            root = etree.parse(zippy.open('word/document.xml'))
+            sectPr = root.find('.//w:body/w:sectPr', namespaces=nsmap)
+            assert sectPr is root.find('.//w:body', namespaces=nsmap)[-1]
+            check_tag(sectPr, ['sectPr', 'headerReference', 'headerReference',
+                               'footerReference', 'pgSz', 'pgMar', 'cols',
+                               'titlePg', 'docGrid'])
+            for ref in sectPr.findall('w:headerReference', namespaces=nsmap):
+                assert targets[ref.get(qname('r', 'id'))] == 'header1.xml'
+            ref = sectPr.find('w:footerReference', namespaces=nsmap)
+            assert targets[ref.get(qname('r', 'id'))] == 'footer1.xml'
+
+    assert blobs[0] == blobs[1] == hdr.tostring()
+    assert hdr.tostring() is hdr.tostring()
+    canonical = hdr.tostring(canonical=True)
+    assert canonical is hdr.tostring(canonical=True)
+    assert canonical != hdr.tostring()
+
+def test_page_setup():
+    doc = Document()
+    doc.page_setup(15840, 12240, 'landscape', top=720, bottom=720)
+    pgSz = doc.sectPr.find('w:pgSz', namespaces=nsmap)
+    assert pgSz.get(qname('w', 'w')) == '15840'
+    assert pgSz.get(qname('w', 'orient')) == 'landscape'
+    pgMar = doc.sectPr.find('w:pgMar', namespaces=nsmap)
+    assert pgMar.get(qname('w', 'top')) == '720'
+    assert pgMar.get(qname('w', 'left')) == '1800'
+
 def test_core_props():
     doc = Document()
     attrs = dict(lastModifiedBy='Joe Smith',
@@ -69,3 +127,148 @@ def test_core_props():
     attr = core.find('.//dcterms:created', namespaces=nsmap)
     assert attr is not None
     assert datetime.strptime(attr.text, '%Y-%m-%dT%H:%M:%SZ') == datetime(*attrs['created'].timetuple()[:6])
+
+def test_core_props_escape():
+    doc = Document()
+    doc.update(title='Fish & <Chips>', language='en-US', revision=3,
+               modified=datetime(2014, 1, 20, 8, 30))
+    core = doc.get_core_props()
+    assert core.find('dc:title', namespaces=nsmap).text == 'Fish & <Chips>'
+    assert core.find('dc:language', namespaces=nsmap).text == 'en-US'
+    assert core.find('cp:revision', namespaces=nsmap).text == '3'
+    attr = core.find('dcterms:modified', namespaces=nsmap)
+    assert attr.text == '2014-01-20T08:30:00Z'
+    assert attr.get(qname('xsi', 'type')) == 'dcterms:W3CDTF'
+
+def test_props_illegal_chars():
+    doc = Document()
+    doc.update(title='bad\x01char')
+    try:
+        doc.dumps_core_props()
+    except ValueError:
+        pass
+    else:
+        assert False
+
+    for custom in ({'bad\x0bname': 'value'}, {'name': 'bad\x00value'}):
+        doc = Document()
+        doc.update_custom(custom)
+        try:
+            doc.dumps_custom_props()
+        except ValueError:
+            pass
+        else:
+            assert False
+
+def test_app_props():
+    doc = Document()
+    doc.append(h1(run('Moby Dick')),
+               paragraph([run('Call me '), run('Ishmael.', 'b')]),
+               paragraph())
+    assert doc.stats == dict(paragraphs=2, words=5, characters=22,
+                             characters_with_spaces=25)
+
+    app = etree.fromstring(doc.dumps_app_props())
+    assert app.find('ep:Words', namespaces=nsmap).text == '5'
+    assert app.find('ep:Paragraphs', namespaces=nsmap).text == '2'
+
+    # content added behind append() is counted on save
+    doc.body.append(paragraph(run('Some years ago')))
+    app = etree.fromstring(doc.dumps_app_props())
+    assert app.find('ep:Words', namespaces=nsmap).text == '8'
+    assert app.find('ep:Paragraphs', namespaces=nsmap).text == '3'
+
+    # content replaced behind append(), the number of elements unchanged
+    doc = Document()
+    doc.append(paragraph([run('one two three')]))
+    doc.body.remove(doc.body[0])
+    doc.body.append(paragraph([run('x')]))
+    app = etree.fromstring(doc.dumps_app_props())
+    assert app.find('ep:Words', namespaces=nsmap).text == '1'
+
+    # and then appended to
+    doc = Document()
+    doc.append(paragraph([run('one two three')]))
+    doc.body.remove(doc.body[0])
+    doc.body.append(paragraph([run('x')]))
+    doc.append(paragraph([run('y z')]))
+    app = etree.fromstring(doc.dumps_app_props())
+    assert app.find('ep:Words', namespaces=nsmap).text == '3'
+    assert doc.stats['paragraphs'] == 2
+
+def test_custom_props():
+    doc = Document()
+    doc.update_custom(client='ACME & Co', reviewed=True, copies=3)
+    tmp = BytesIO()
+    doc.save(tmp)
+
+    with ZipFile(tmp) as zippy:
+        assert 'docProps/custom.xml' in zippy.namelist()
+        root = etree.parse(zippy.open('docProps/custom.xml')).getroot()
+        props = dict((el.get('name'), (etree.QName(el[0]).localname,
+                                       el[0].text)) for el in root)
+        assert props == {'client': ('lpwstr', 'ACME & Co'),
+                         'copies': ('i4', '3'),
+                         'reviewed': ('bool', 'true')}
+        assert [el.get('pid') for el in root] == ['2', '3', '4']
+
+        rels = etree.parse(zippy.open('_rels/.rels')).getroot()
+        assert 'docProps/custom.xml' in [el.get('Target') for el in rels]
+        types = etree.parse(zippy.open('[Content_Types].xml')).getroot()
+        assert '/docProps/custom.xml' in [el.get('PartName') for el in types]
+
+def test_deterministic_save():
+    def build():
+        doc = Document()
+        doc.update(title='Report', created=datetime(2014, 1, 20))
+        doc.append(h1(run('Summary')), paragraph([run('All good.')]))
+        doc.add_footer(footer(paragraph([pagenumber()])))
+        return doc
+
+    blobs, hashes = [], []
+    for i in range(2):
+        doc = build()
+        tmp = BytesIO()
+        hashes.append(doc.save(tmp, deterministic=True))
+        blobs.append(tmp.getvalue())
+        assert hashes[-1] == doc.content_hash()
+    assert blobs[0] == blobs[1]
+    assert hashes[0] == hashes[1]
+
+    with ZipFile(BytesIO(blobs[0])) as zippy:
+        assert(zippy.testzip() is None)
+        names = zippy.namelist()
+        assert names == sorted(names)
+        assert names[0] == '[Content_Types].xml'
+        assert set(info.date_time for info in zippy.infolist()) == \
+            set([(1980, 1, 1, 0, 0, 0)])
+        check_tag(etree.parse(zippy.open('word/document.xml')),
+                  'document body p pPr pStyle r t'.split())
+
+    doc = build()
+    doc.append(paragraph([run('One more thing.')]))
+    assert doc.content_hash() != hashes[0]
+
+def test_validate():
+    doc = Document()
+    doc.append(h1(run('Summary')), paragraph([run('All good.', ['b', 'u'])]))
+    doc.add_header(header(paragraph([run('ACME')])))
+    doc.validate()
+
+    # the section properties were appended ahead of the content
+    doc = Document()
+    doc.page_setup(top=720)
+    doc.body.append(paragraph([run('late')]))
+    doc.validate()
+
+    doc = Document()
+    doc.body.append(E.p(E.r(E.t('text')), E.pPr()))
+    set_validation('strict')
+    try:
+        doc.save(BytesIO())
+    except etree.DocumentInvalid:
+        pass
+    else:
+        assert False, 'expect DocumentInvalid'
+    finally:
+        set_validation('default')
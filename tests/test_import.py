@@ -0,0 +1,53 @@
+import compileall
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import SkipTest
+
+import docxgen
+
+# cold ``import docxgen`` budget in microseconds, lxml and six excluded.
+IMPORT_BUDGET = 25000
+DEPENDENCIES = ('lxml', 'lxml.etree', 'lxml.builder', 'six')
+
+def _importtime(path):
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', 'import docxgen'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=path)
+    _, err = proc.communicate()
+    return err.decode('utf-8')
+
+def _own_time(report):
+    '''cumulative import time of docxgen less its dependencies.'''
+    rows = re.findall(r'^import time:\s*\d+ \|\s*(\d+) \|( *)(\S+)$',
+                      report, re.M)
+    total = [int(cumulative) for cumulative, _, name in rows
+             if name == 'docxgen'][0]
+    # direct children of docxgen are indented by two spaces
+    return total - sum(int(cumulative) for cumulative, indent, name in rows
+                       if len(indent) == 3 and name in DEPENDENCIES)
+
+def test_import_time():
+    if sys.version_info < (3, 7):
+        raise SkipTest('-X importtime requires Python 3.7+')
+    # time the import of the bytecode rather than the compiler, compiled in
+    # a copy of the package to keep the source tree clean.
+    path = tempfile.mkdtemp()
+    package = os.path.join(path, 'docxgen')
+    try:
+        shutil.copytree(os.path.dirname(docxgen.__file__), package,
+                        ignore=shutil.ignore_patterns('__pycache__'))
+        compileall.compile_dir(package, quiet=1)
+        reports = [_importtime(path) for i in range(3)]
+    finally:
+        shutil.rmtree(path)
+    modules = re.findall(r'\|\s*(\S+)\s*$', reports[0], re.M)
+    assert 'pkg_resources' not in modules
+    assert 'zipfile' not in modules
+
+    elapsed = min(_own_time(report) for report in reports)
+    assert elapsed < IMPORT_BUDGET, \
+        "import docxgen took %sus, budget %sus" % (elapsed, IMPORT_BUDGET)
@@ -1,6 +1,8 @@
+from itertools import permutations
 from re import split
 from docxgen import *
 from docxgen import E
+from lxml import etree
 from . import check_tag
 
 def test_run():
@@ -54,7 +56,122 @@ def test_table():
         [run('4'), run('3'), run('9')],
     ], 'LightShading-Accent1')
     check_tag(root, split(r'\s+', '''tbl tblPr tblStyle
-    tr trPr cnfStyle tc tcPr tcW p r t tc tcPr tcW p r t tc tcPr tcW p r t
-    tr trPr cnfStyle tc tcPr tcW p r t tc tcPr tcW p r t tc tcPr tcW p r t
-    tr trPr cnfStyle tc tcPr tcW p r t tc tcPr tcW p r t tc tcPr tcW p r t
+    tblGrid gridCol gridCol gridCol
+    tr trPr cnfStyle tc p r t tc p r t tc p r t
+    tr trPr cnfStyle tc p r t tc p r t tc p r t
+    tr trPr cnfStyle tc p r t tc p r t tc p r t
     '''))
+    validate(root)
+
+def test_field():
+    root = pagenumber()
+    check_tag(root, ['fldSimple', 'r', 't'])
+    assert root.get(qname('w', 'instr')) == ' PAGE '
+    assert numpages().get(qname('w', 'instr')) == ' NUMPAGES '
+
+def test_header_footer():
+    part = header(paragraph([run('Page '), pagenumber()]))
+    assert part.kind == 'header'
+    check_tag(part.root, ['hdr', 'p', 'r', 't', 'fldSimple', 'r', 't'])
+    assert part.tostring() is part.tostring()
+
+    part = footer([paragraph([run('ACME')])])
+    assert part.kind == 'footer'
+    check_tag(part.root, ['ftr', 'p', 'r', 't'])
+
+def test_validate():
+    validate(paragraph([run('bold italic', ['b', 'i'])], 'Heading1'))
+    validate(table([[run('1'), run('2')]], 'LightShading-Accent1'))
+    validate(header(paragraph([pagenumber()])).root)
+
+    # rPr children are ordered, b MUST precede i
+    try:
+        validate(paragraph([run('italic bold', E.rPr(E.i(), E.b()))]))
+    except etree.DocumentInvalid:
+        pass
+    else:
+        assert False, 'expect DocumentInvalid'
+
+    # ECMA-376 requires a tblGrid in tbl and a block in hdr and ftr
+    for element in (E.tbl(E.tblPr(), E.tr(E.tc(E.p()))), E.hdr(), E.ftr()):
+        try:
+            validate(element)
+        except etree.DocumentInvalid:
+            pass
+        else:
+            assert False, 'expect DocumentInvalid'
+    for builder in (header, footer):
+        try:
+            builder([])
+        except AssertionError:
+            pass
+        else:
+            assert False, 'expect AssertionError'
+
+def test_run_styles_validate():
+    styles = ['b', 'i', 'u', 'h', 'color:FF0000', 'size:48']
+    for length in range(1, len(styles) + 1):
+        for style in permutations(styles, length):
+            validate(paragraph([run('styled', list(style))]))
+
+def test_validation_off():
+    rows = [[run('1'), run('2')]]
+    try:
+        table(rows, widths=[1440])
+    except AssertionError:
+        pass
+    else:
+        assert False, 'expect AssertionError'
+
+    set_validation('off')
+    try:
+        root = table(rows, widths=[1440])
+        check_tag(root, '''tbl tblPr tblW tblLayout tblGrid gridCol
+        tr trPr cnfStyle tc p r t tc p r t'''.split())
+    finally:
+        set_validation('default')
+
+    try:
+        set_validation('bogus')
+    except ValueError:
+        pass
+    else:
+        assert False, 'expect ValueError'
+
+def test_table_widths():
+    rows = [[run('Name'), run('Description')]] + [
+        [run('item %d' % i), run('a rather long description of the item')]
+        for i in range(10)]
+    root = table(rows, 'LightShading-Accent1', widths=[2880, 6480], header=1)
+    check_tag(root, '''tbl tblPr tblStyle tblW tblLayout
+    tblGrid gridCol gridCol
+    tr trPr cnfStyle tblHeader tc p r t tc p r t
+    tr trPr cnfStyle tc p r t tc p r t
+    '''.split())
+    cols = root.findall('w:tblGrid/w:gridCol', namespaces=nsmap)
+    assert [col.get(qname('w', 'w')) for col in cols] == ['2880', '6480']
+    layout = root.find('w:tblPr/w:tblLayout', namespaces=nsmap)
+    assert layout.get(qname('w', 'type')) == 'fixed'
+    assert len(root.findall('.//w:tblHeader', namespaces=nsmap)) == 1
+    assert root.find('.//w:tcPr', namespaces=nsmap) is None
+    validate(root)
+
+    # distribute the total width by the content sample
+    root = table(rows, 'LightShading-Accent1', widths=9360)
+    widths = [int(col.get(qname('w', 'w'))) for col in
+              root.findall('w:tblGrid/w:gridCol', namespaces=nsmap)]
+    assert sum(widths) == 9360
+    assert widths[0] < widths[1]
+    validate(root)
+
+    # ragged rows and float widths
+    ragged = [[run('a')], [run('b'), run('c'), run('d')]]
+    root = table(ragged, widths=4320.0)
+    cols = root.findall('w:tblGrid/w:gridCol', namespaces=nsmap)
+    assert len(cols) == 3
+    assert sum(int(col.get(qname('w', 'w'))) for col in cols) == 4320
+    width = root.find('w:tblPr/w:tblW', namespaces=nsmap)
+    assert width.get(qname('w', 'w')) == '4320'
+    root = table([[run('1'), run('2')]], widths=[1440.0, 2880.0])
+    cols = root.findall('w:tblGrid/w:gridCol', namespaces=nsmap)
+    assert [col.get(qname('w', 'w')) for col in cols] == ['1440', '2880']